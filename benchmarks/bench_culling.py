@@ -0,0 +1,43 @@
+import argparse
+
+from .common import init_taichi, make_renderer, add_particle_cloud, time_frames
+
+
+def main(args):
+    init_taichi(args.render_device)
+
+    results = {}
+    for name, culling, num_particles in (('floor only', True, 0),
+                                         ('no culling', False, args.num_particles),
+                                         ('culling', True, args.num_particles)):
+        renderer = make_renderer(tuple(args.resolution), args.num_particles,
+                                 culling=culling)
+        add_particle_cloud(renderer, num_particles, args.extent, 0.01)
+        renderer.reorder_particles()
+        renderer.recompute_bbox()
+        results[name] = time_frames(renderer, args.frames, args.spp)
+
+    print(f"Particles: {args.num_particles}, extent: {args.extent}, resolution: {args.resolution}")
+    for name, frame_time in results.items():
+        print(f"{name:>10}: {frame_time * 1000:.2f} ms/frame")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Measure the effect of bounds culling on render time.")
+    parser.add_argument('--render_device', type=str, default='cpu',
+                        help='Device to use for rendering (cpu or gpu).')
+    parser.add_argument('--resolution', type=int, nargs=2, default=(320, 240),
+                        help='Resolution of the rendered image (width height).')
+    parser.add_argument('--num_particles', type=int, default=2000,
+                        help='Number of randomly placed particles.')
+    parser.add_argument('--extent', type=float, default=0.3,
+                        help='Edge length of the cube the particles are placed in.')
+    parser.add_argument('--frames', type=int, default=5,
+                        help='Number of frames to time.')
+    parser.add_argument('--spp', type=int, default=1,
+                        help='Samples per pixel per frame.')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,84 @@
+import argparse
+import time
+
+import taichi as ti
+
+from .common import init_taichi, make_renderer, add_particle_cloud
+
+
+@ti.kernel
+def heavy_update(renderer: ti.template(), dt: ti.f32, iterations: ti.i32):
+    # Synthetic simulation step with a tunable amount of work per particle
+    for i in range(renderer.num_particles[None]):
+        phase = renderer.particle_pos[i][0]
+        for _ in range(iterations):
+            phase = ti.sin(phase + dt)
+        renderer.particle_pos[i][1] += 1e-6 * phase
+
+
+def run_frames(renderer, frames, dt, iterations, simulate=True, render=True):
+    t = time.time()
+    for _ in range(frames):
+        if not simulate:
+            renderer.snapshot_particles()
+            renderer.recompute_bbox()
+        elif renderer.pipelined:
+            renderer.snapshot_particles()
+            renderer.recompute_bbox()
+            heavy_update(renderer, dt, iterations)
+        else:
+            heavy_update(renderer, dt, iterations)
+            renderer.recompute_bbox()
+        if render:
+            renderer.reset_framebuffer()
+            renderer.accumulate()
+            renderer.fetch_image()
+
+    ti.sync()
+    return (time.time() - t) / frames
+
+
+def main(args):
+    init_taichi(args.render_device)
+
+    results = {}
+    for pipelined in (False, True):
+        renderer = make_renderer(tuple(args.resolution), args.num_particles,
+                                 pipelined=pipelined)
+        add_particle_cloud(renderer, args.num_particles, 1.0, 0.01)
+        renderer.snapshot_particles()
+
+        # Warm up so that compilation is not timed
+        run_frames(renderer, 1, 0.01, args.sim_iterations)
+        results[pipelined] = run_frames(renderer, args.frames, 0.01,
+                                        args.sim_iterations)
+
+    sim_time = run_frames(renderer, args.frames, 0.01, args.sim_iterations,
+                          render=False)
+    render_time = run_frames(renderer, args.frames, 0.01, args.sim_iterations,
+                             simulate=False)
+
+    print(f"Particles: {args.num_particles}, resolution: {args.resolution}")
+    print(f"Sim only:    {sim_time * 1000:.2f} ms/frame")
+    print(f"Render only: {render_time * 1000:.2f} ms/frame")
+    print(f"Sequential:  {results[False] * 1000:.2f} ms/frame")
+    print(f"Pipelined:   {results[True] * 1000:.2f} ms/frame")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare sequential and pipelined simulation and rendering.")
+    parser.add_argument('--render_device', type=str, default='cpu',
+                        help='Device to use for rendering (cpu or gpu).')
+    parser.add_argument('--resolution', type=int, nargs=2, default=(320, 240),
+                        help='Resolution of the rendered image (width height).')
+    parser.add_argument('--num_particles', type=int, default=500,
+                        help='Number of randomly placed particles.')
+    parser.add_argument('--sim_iterations', type=int, default=20000,
+                        help='Work per particle in the synthetic simulation step.')
+    parser.add_argument('--frames', type=int, default=10,
+                        help='Number of frames to time.')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import subprocess
+import time
+
+import numpy as np
+import taichi as ti
+
+from .common import init_taichi, make_renderer, add_particle_arrays
+
+# Renderer configurations to compare. 'specialize' selects kernels specialized
+# to the detected scene traits, everything else is passed to Renderer.
+MODES = {
+    'default': {},
+    'generic': {'specialize': False},
+    'no_culling': {'culling': False},
+    'compact': {'color_format': 'u8', 'radius_format': 'f16'},
+    'palette': {'color_format': 'palette', 'radius_format': 'f16'},
+}
+
+# References are rendered without any of the optimizations under test, so a
+# bias they introduce shows up as error instead of being baked into the reference
+REFERENCE_MODE = {'specialize': False, 'culling': False,
+                  'color_format': 'f32', 'radius_format': 'f32'}
+
+PALETTE = np.array([[1.0, 0.0, 0.0],
+                    [0.9, 0.6, 0.1],
+                    [0.2, 0.4, 0.9],
+                    [0.9, 0.9, 0.9]], dtype=np.float32)
+
+
+def scene_cloud(rng):
+    """2000 particles with four colors in a cube floating above the floor."""
+    n = 2000
+    pos = (rng.random((n, 3), dtype=np.float32) - 0.5) * 0.4
+    color = PALETTE[rng.integers(0, len(PALETTE), n)]
+    radius = np.full(n, 0.01, dtype=np.float32)
+    return {'pos': pos, 'color': color, 'radius': radius,
+            'camera_pos': (0.0, 0.3, 2.0), 'look_at': (0.0, 0.0, 0.0)}
+
+
+def scene_grid(rng):
+    """The HelloWorld grid of red particles at random heights."""
+    num_x, num_z, spacing = 40, 25, 0.05
+    i, j = np.meshgrid(np.arange(num_x), np.arange(num_z), indexing='ij')
+    pos = np.stack([(i.ravel() - num_x // 2) * spacing,
+                    rng.random(num_x * num_z) * 0.5,
+                    (j.ravel() - num_z // 2) * spacing], axis=1).astype(np.float32)
+    color = np.tile(np.array([[1.0, 0.0, 0.0]], dtype=np.float32), (len(pos), 1))
+    radius = np.full(len(pos), 0.01, dtype=np.float32)
+    return {'pos': pos, 'color': color, 'radius': radius,
+            'camera_pos': (0.19, 0.1, 2.61), 'look_at': (-0.05, -0.37, -0.1)}
+
+
+SCENES = {
+    'cloud': scene_cloud,
+    'grid': scene_grid,
+}
+
+
+def build_renderer(args, scene_name, mode, render_seed):
+    """
+    Set up a fresh runtime and renderer for one scene and mode. The particle
+    layout only depends on args.seed, render_seed seeds the sampling.
+    """
+    init_taichi(args.render_device, seed=render_seed)
+
+    scene = SCENES[scene_name](np.random.default_rng(args.seed))
+    renderer_kwargs = {k: v for k, v in mode.items() if k != 'specialize'}
+    renderer = make_renderer(tuple(args.resolution), len(scene['pos']),
+                             **renderer_kwargs)
+    renderer.set_camera_pos(*scene['camera_pos'])
+    renderer.set_look_at(*scene['look_at'])
+
+    add_particle_arrays(renderer, scene['pos'], scene['color'], scene['radius'], 1)
+    renderer.snapshot_particles()
+    renderer.recompute_bbox()
+    if mode.get('specialize', True):
+        renderer.specialize()
+    renderer.reset_framebuffer()
+    return renderer
+
+
+def error_metrics(image, reference):
+    rmse = float(np.sqrt(np.mean((image - reference) ** 2)))
+    psnr = float(20 * np.log10(1.0 / rmse)) if rmse > 0 else float('inf')
+    return rmse, psnr
+
+
+def render_reference(args, scene_name):
+    """Render, or load from args.reference_dir, the high-spp reference image."""
+    path = None
+    if args.reference_dir:
+        width, height = args.resolution
+        fname = f"{scene_name}-{width}x{height}-{args.reference_spp}spp-seed{args.seed}-plain.npy"
+        path = os.path.join(args.reference_dir, fname)
+        if os.path.exists(path):
+            return np.load(path)
+
+    # Sample with a different seed than the measured runs so that their first
+    # samples are not also part of the reference
+    renderer = build_renderer(args, scene_name, REFERENCE_MODE, args.seed + 1)
+    for _ in range(args.reference_spp):
+        renderer.accumulate()
+    reference = renderer.fetch_image().to_numpy()
+
+    if path is not None:
+        os.makedirs(args.reference_dir, exist_ok=True)
+        np.save(path, reference)
+    return reference
+
+
+def run_mode(args, scene_name, mode, reference):
+    """
+    Accumulate samples for args.time_budget seconds of render time and record
+    the error against the reference after every power of two samples per pixel.
+    Time spent measuring the error is not counted against the budget.
+    """
+    renderer = build_renderer(args, scene_name, mode, args.seed)
+
+    # Warm up so that compilation is not timed
+    renderer.accumulate()
+    renderer.fetch_image()
+    ti.sync()
+    renderer.reset_framebuffer()
+
+    curve = []
+    render_time = 0.0
+    next_checkpoint = 1
+    while render_time < args.time_budget:
+        t = time.time()
+        renderer.accumulate()
+        ti.sync()
+        render_time += time.time() - t
+
+        if renderer.current_spp == next_checkpoint or render_time >= args.time_budget:
+            rmse, psnr = error_metrics(renderer.fetch_image().to_numpy(), reference)
+            curve.append({'time': render_time, 'spp': renderer.current_spp,
+                          'rmse': rmse, 'psnr': psnr})
+            next_checkpoint *= 2
+    return curve
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args):
+    results = {'revision': git_revision(),
+               'render_device': args.render_device,
+               'resolution': list(args.resolution),
+               'reference_spp': args.reference_spp,
+               'time_budget': args.time_budget,
+               'seed': args.seed,
+               'scenes': {}}
+
+    for scene_name in args.scenes:
+        reference = render_reference(args, scene_name)
+        results['scenes'][scene_name] = {}
+        for mode_name in args.modes:
+            curve = run_mode(args, scene_name, MODES[mode_name], reference)
+            results['scenes'][scene_name][mode_name] = curve
+            final = curve[-1]
+            print(f"{scene_name:>8} {mode_name:>10}: {final['spp']:>5} spp in {final['time']:.2f}s, "
+                  f"RMSE {final['rmse']:.4f}, PSNR {final['psnr']:.2f} dB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results have been saved to {args.output}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Measure image error against high-spp references over render time.")
+    parser.add_argument('--render_device', type=str, default='cpu',
+                        help='Device to use for rendering (cpu or gpu).')
+    parser.add_argument('--resolution', type=int, nargs=2, default=(160, 120),
+                        help='Resolution of the rendered images (width height).')
+    parser.add_argument('--scenes', type=str, nargs='+', default=list(SCENES),
+                        choices=list(SCENES), help='Scenes to render.')
+    parser.add_argument('--modes', type=str, nargs='+', default=list(MODES),
+                        choices=list(MODES), help='Renderer modes to compare.')
+    parser.add_argument('--reference_spp', type=int, default=1024,
+                        help='Samples per pixel of the reference images.')
+    parser.add_argument('--reference_dir', type=str, default=None,
+                        help='Directory to cache reference images in.')
+    parser.add_argument('--time_budget', type=float, default=5.0,
+                        help='Render time in seconds per scene and mode.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the particle layouts and the renderer.')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Path of the JSON file to write the error curves to.')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,43 @@
+import argparse
+
+from .common import init_taichi, make_renderer, add_particle_cloud, time_frames
+
+
+def main(args):
+    init_taichi(args.render_device)
+
+    renderer = make_renderer(tuple(args.resolution), args.num_particles)
+    add_particle_cloud(renderer, args.num_particles, 1.0, args.radius)
+    renderer.recompute_bbox()
+
+    unsorted_time = time_frames(renderer, args.frames, args.spp)
+
+    renderer.reorder_particles()
+    renderer.recompute_bbox()
+    sorted_time = time_frames(renderer, args.frames, args.spp)
+
+    print(f"Particles: {args.num_particles}, resolution: {args.resolution}, spp: {args.spp}")
+    print(f"Insertion order: {unsorted_time * 1000:.2f} ms/frame")
+    print(f"Morton order:    {sorted_time * 1000:.2f} ms/frame")
+    print(f"Speedup:         {unsorted_time / sorted_time:.2f}x")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Measure the effect of Morton reordering on render time.")
+    parser.add_argument('--render_device', type=str, default='cpu',
+                        help='Device to use for rendering (cpu or gpu).')
+    parser.add_argument('--resolution', type=int, nargs=2, default=(320, 240),
+                        help='Resolution of the rendered image (width height).')
+    parser.add_argument('--num_particles', type=int, default=2000,
+                        help='Number of randomly placed particles.')
+    parser.add_argument('--radius', type=float, default=0.01,
+                        help='Radius of the particles.')
+    parser.add_argument('--frames', type=int, default=10,
+                        help='Number of frames to time.')
+    parser.add_argument('--spp', type=int, default=1,
+                        help='Samples per pixel per frame.')
+
+    args = parser.parse_args()
+
+    main(args)
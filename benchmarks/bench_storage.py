@@ -0,0 +1,51 @@
+import argparse
+
+from rendering.renderer import COLOR_FORMATS, RADIUS_FORMATS
+from .common import init_taichi, make_renderer, add_particle_cloud, time_frames
+
+
+def main(args):
+    init_taichi(args.render_device)
+
+    pixels = args.resolution[0] * args.resolution[1]
+    print(f"Particles: {args.num_particles}, resolution: {args.resolution}, spp: {args.spp}")
+    print(f"{'color':>8} {'radius':>7} {'render B/p':>11} {'total B/p':>10} {'total MB':>9} {'Msamples/s':>11}")
+
+    for color_format in args.color_formats:
+        for radius_format in args.radius_formats:
+            renderer = make_renderer(tuple(args.resolution), args.num_particles,
+                                     color_format=color_format,
+                                     radius_format=radius_format)
+            add_particle_cloud(renderer, args.num_particles, 1.0, 0.01)
+            renderer.recompute_bbox()
+
+            frame_time = time_frames(renderer, args.frames, args.spp)
+            samples_per_sec = pixels * args.spp / frame_time
+            memory = renderer.particle_memory_usage()
+            total_mb = memory['total'] * args.num_particles / 2**20
+
+            print(f"{color_format:>8} {radius_format:>7} {memory['render']:>11} "
+                  f"{memory['total']:>10} {total_mb:>9.2f} {samples_per_sec / 1e6:>11.3f}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare memory use and render throughput of particle storage formats.")
+    parser.add_argument('--render_device', type=str, default='cpu',
+                        help='Device to use for rendering (cpu or gpu).')
+    parser.add_argument('--resolution', type=int, nargs=2, default=(320, 240),
+                        help='Resolution of the rendered image (width height).')
+    parser.add_argument('--num_particles', type=int, default=2000,
+                        help='Number of randomly placed particles.')
+    parser.add_argument('--color_formats', type=str, nargs='+', default=COLOR_FORMATS,
+                        help='Color storage formats to compare.')
+    parser.add_argument('--radius_formats', type=str, nargs='+', default=RADIUS_FORMATS,
+                        help='Radius storage formats to compare.')
+    parser.add_argument('--frames', type=int, default=5,
+                        help='Number of frames to time per format.')
+    parser.add_argument('--spp', type=int, default=1,
+                        help='Samples per pixel per frame.')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,74 @@
+import time
+
+import taichi as ti
+from taichi.math import vec3
+
+from rendering.renderer import Renderer
+
+UP_DIR = (0, 1, 0)
+
+
+def init_taichi(device, seed=0):
+    if device == 'cpu':
+        ti.init(arch=ti.cpu, random_seed=seed)
+    elif device == 'gpu':
+        ti.init(arch=ti.gpu, random_seed=seed)
+    else:
+        raise ValueError("Unsupported render device. Use 'cpu' or 'gpu'.")
+
+
+def make_renderer(resolution, max_particles, **kwargs):
+    """
+    Create a headless renderer looking at a particle cloud centered at the origin.
+    """
+    renderer = Renderer(image_res=resolution,
+                        up=UP_DIR,
+                        exposure=10.0,
+                        max_particles=max_particles,
+                        **kwargs)
+    renderer.set_camera_pos(0.0, 0.3, 2.0)
+    renderer.set_look_at(0.0, 0.0, 0.0)
+    renderer.floor_height[None] = -0.5
+    renderer.floor_color[None] = (0.8, 0.8, 0.8)
+    renderer.set_directional_light((0, 1, 0), 0.1, (0.1, 0.1, 0.1))
+    return renderer
+
+
+@ti.kernel
+def add_particle_cloud(renderer: ti.template(), n: ti.i32, extent: ti.f32,
+                       radius: ti.f32):
+    # Random positions in insertion order, i.e. without any spatial coherence
+    for _ in range(n):
+        pos = (vec3(ti.random(), ti.random(), ti.random()) - 0.5) * extent
+        renderer.add_particle(pos, vec3(1.0, 0.0, 0.0), 1, radius,
+                              vec3(0.0, 0.0, 0.0))
+
+
+@ti.kernel
+def add_particle_arrays(renderer: ti.template(), pos: ti.types.ndarray(),
+                        color: ti.types.ndarray(), radius: ti.types.ndarray(),
+                        material: ti.i32):
+    # Serialized so that particles land in the same slots as in the arrays
+    ti.loop_config(serialize=True)
+    for i in range(pos.shape[0]):
+        renderer.add_particle(vec3(pos[i, 0], pos[i, 1], pos[i, 2]),
+                              vec3(color[i, 0], color[i, 1], color[i, 2]),
+                              material, radius[i], vec3(0.0, 0.0, 0.0))
+
+
+def time_frames(renderer, frames, spp):
+    """Return the average wall time in seconds of rendering one frame."""
+    # Warm up so that compilation is not timed
+    renderer.reset_framebuffer()
+    renderer.accumulate()
+    renderer.fetch_image()
+    ti.sync()
+
+    t = time.time()
+    for _ in range(frames):
+        renderer.reset_framebuffer()
+        for _ in range(spp):
+            renderer.accumulate()
+        renderer.fetch_image()
+    ti.sync()
+    return (time.time() - t) / frames
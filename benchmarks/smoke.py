@@ -0,0 +1,69 @@
+import argparse
+
+import taichi as ti
+
+from .common import init_taichi, make_renderer, add_particle_cloud
+
+
+@ti.kernel
+def fall(renderer: ti.template(), dt: ti.f32):
+    for i in range(renderer.num_particles[None]):
+        renderer.particle_velocity[i][1] -= 9.81 * dt
+        renderer.particle_pos[i] += renderer.particle_velocity[i] * dt
+
+
+def main(args):
+    """
+    Run a few frames through the same renderer calls as Scene.finish, without
+    opening a window.
+    """
+    init_taichi(args.render_device)
+
+    renderer = make_renderer(tuple(args.resolution), args.num_particles,
+                             pipelined=args.pipelined)
+    add_particle_cloud(renderer, args.num_particles, 0.5, 0.01)
+
+    renderer.snapshot_particles()
+    renderer.recompute_bbox()
+    renderer.specialize()
+
+    dt = 1.0 / 30
+    for frame in range(args.frames):
+        if args.pipelined:
+            if frame % 2 == 0:
+                renderer.reorder_particles()
+            renderer.snapshot_particles()
+            renderer.recompute_bbox()
+            renderer.validate_traits()
+            fall(renderer, dt)
+        else:
+            fall(renderer, dt)
+            if frame % 2 == 0:
+                renderer.reorder_particles()
+            renderer.recompute_bbox()
+            renderer.validate_traits()
+        renderer.reset_framebuffer()
+        renderer.accumulate()
+        renderer.fetch_image()
+    ti.sync()
+
+    print(f"Rendered {args.frames} frames with traits {renderer.traits}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Headless smoke run of the Scene.finish frame loop.")
+    parser.add_argument('--render_device', type=str, default='cpu',
+                        help='Device to use for rendering (cpu or gpu).')
+    parser.add_argument('--resolution', type=int, nargs=2, default=(80, 60),
+                        help='Resolution of the rendered image (width height).')
+    parser.add_argument('--num_particles', type=int, default=200,
+                        help='Number of randomly placed particles.')
+    parser.add_argument('--frames', type=int, default=3,
+                        help='Number of frames to run.')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='Render from a double-buffered snapshot of the particles.')
+
+    args = parser.parse_args()
+
+    main(args)
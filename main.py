@@ -69,6 +69,16 @@ if __name__ == "__main__":
                         help='Maximum number of particles the renderer allows.')
     parser.add_argument('--capture', type=bool, default=False,
                         help='Whether to capture a video of the rendering session.')
+    parser.add_argument('--reorder_interval', type=int, default=0,
+                        help='Sort particles along a Morton curve every N frames for cache locality (0 disables).')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='Render from a snapshot of the particles copied at each frame boundary (double-buffered state).')
+    parser.add_argument('--color_format', type=str, default='f32',
+                        help='Storage format of particle colors (f32, f16, u8 or palette).')
+    parser.add_argument('--radius_format', type=str, default='f32',
+                        help='Storage format of particle radii (f32 or f16).')
+    parser.add_argument('--no_culling', dest='culling', action='store_false',
+                        help='Disable skipping particle traversal for rays that miss the particle bounds.')
 
     args = parser.parse_args()
 
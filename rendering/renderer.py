@@ -1,6 +1,10 @@
+from dataclasses import dataclass, replace
+
+import numpy as np
 import taichi as ti
 
-from .renderutils import (eps, inf, out_dir, ray_aabb_intersection)
+from .renderutils import (eps, inf, out_dir, ray_aabb_intersection, morton3d,
+                          field_element_bytes)
 
 MAX_RAY_DEPTH = 4
 use_directional_light = True
@@ -10,9 +14,41 @@ DIS_LIMIT = 100
 MAT_LAMBERTIAN = 1
 MAT_LIGHT = 2
 
+COLOR_FORMATS = ('f32', 'f16', 'u8', 'palette')
+RADIUS_FORMATS = ('f32', 'f16')
+MAX_PALETTE_COLORS = 256
+# Component value of palette entries that have not been written yet
+PALETTE_UNSET = -1.0
+
+# Consecutive particle slots that share one bounding box for culling
+CLUSTER_SIZE = 32
+
+
+@dataclass(frozen=True)
+class SceneTraits:
+    """
+    Particle attributes that are the same for every particle in the scene.
+    Uniform attributes are compiled into the render kernel as constants instead
+    of being read per particle. The default instance is the generic path.
+    """
+    uniform_radius: bool = False
+    radius: float = 0.0
+    uniform_material: bool = False
+    material: int = 0
+    uniform_color: bool = False
+    color: tuple = (0.0, 0.0, 0.0)
+
+
 @ti.data_oriented
 class Renderer:
-    def __init__(self, image_res, up, exposure=3, max_particles=100):
+    def __init__(self, image_res, up, exposure=3, max_particles=100,
+                 pipelined=False, color_format='f32', radius_format='f32',
+                 culling=True):
+        if color_format not in COLOR_FORMATS:
+            raise ValueError(f"Unsupported color format. Use one of {COLOR_FORMATS}.")
+        if radius_format not in RADIUS_FORMATS:
+            raise ValueError(f"Unsupported radius format. Use one of {RADIUS_FORMATS}.")
+
         self.image_res = image_res
         self.aspect_ratio = image_res[0] / image_res[1]
         self.vignette_strength = 0.9
@@ -45,19 +81,80 @@ class Renderer:
 
         self.max_particles = max_particles
         self.num_particles = ti.field(dtype=ti.i32, shape=())
+        self.color_format = color_format
+        self.radius_format = radius_format
+
+        # Colors are stored either directly or as indices into a shared palette
+        self.color_palette = ti.Vector.field(3, dtype=ti.f32, shape=MAX_PALETTE_COLORS)
+        self.palette_size = ti.field(dtype=ti.i32, shape=())
+        self.color_palette.fill(PALETTE_UNSET)
+
+        # Attributes read by the renderer share one struct per particle,
+        # velocity is only touched by the simulation and lives on its own
         self.particle_pos = ti.Vector.field(3, dtype=ti.f32)
-        self.particle_color = ti.Vector.field(3, dtype=ti.f32)
+        self.particle_color = self._make_color_field()
         self.particle_material = ti.field(dtype=ti.i8)
-        self.particle_radius = ti.field(dtype=ti.f32)
+        self.particle_radius = self._make_radius_field()
         self.particle_velocity = ti.Vector.field(3, dtype=ti.f32)
 
         particle_node = ti.root.dense(ti.i, self.max_particles)
         particle_node.place(self.particle_pos,
                             self.particle_color,
                             self.particle_material,
-                            self.particle_radius,
-                            self.particle_velocity)
-
+                            self.particle_radius)
+        ti.root.dense(ti.i, self.max_particles).place(self.particle_velocity)
+
+        # Stable particle ids. particle_id maps a storage slot to the id the
+        # particle was created with, particle_slot maps an id back to its slot.
+        self.particle_id = ti.field(dtype=ti.i32)
+        self.particle_slot = ti.field(dtype=ti.i32)
+        self._morton_code = ti.field(dtype=ti.u32)
+        self._morton_bbox = ti.Vector.field(3, dtype=ti.f32, shape=2)
+        ti.root.dense(ti.i, self.max_particles).place(self.particle_id,
+                                                      self.particle_slot,
+                                                      self._morton_code)
+
+        # Per-particle fields that are permuted when particles are reordered
+        self._particle_fields = [self.particle_pos,
+                                 self.particle_color,
+                                 self.particle_material,
+                                 self.particle_radius,
+                                 self.particle_velocity,
+                                 self.particle_id]
+
+        # In pipelined mode the simulation works on the particle_* fields while
+        # the renderer traces a snapshot taken at the last frame boundary.
+        self.pipelined = pipelined
+        if self.pipelined:
+            self.render_num_particles = ti.field(dtype=ti.i32, shape=())
+            self.render_pos = ti.Vector.field(3, dtype=ti.f32)
+            self.render_color = self._make_color_field()
+            self.render_material = ti.field(dtype=ti.i8)
+            self.render_radius = self._make_radius_field()
+            ti.root.dense(ti.i, self.max_particles).place(self.render_pos,
+                                                          self.render_color,
+                                                          self.render_material,
+                                                          self.render_radius)
+        else:
+            self.render_num_particles = self.num_particles
+            self.render_pos = self.particle_pos
+            self.render_color = self.particle_color
+            self.render_material = self.particle_material
+            self.render_radius = self.particle_radius
+
+        self.traits = SceneTraits()
+
+        # Rays are first tested against the particle bounds and the bounds of
+        # clusters of CLUSTER_SIZE slots; primary rays additionally check a
+        # screen-space mask of pixels that can see the particle bounds at all.
+        self.culling = culling
+        self.max_clusters = (self.max_particles + CLUSTER_SIZE - 1) // CLUSTER_SIZE
+        self.cluster_min = ti.Vector.field(3, dtype=ti.f32, shape=self.max_clusters)
+        self.cluster_max = ti.Vector.field(3, dtype=ti.f32, shape=self.max_clusters)
+        self.primary_mask = ti.field(dtype=ti.i8, shape=image_res)
+        # The mask depends on the particle bounds and the camera, it is rebuilt
+        # before the next sample whenever either of them changes
+        self._primary_mask_dirty = True
 
         self._rendered_image = ti.Vector.field(3, float, image_res)
         self.set_up(*up)
@@ -66,6 +163,87 @@ class Renderer:
         self.floor_height[None] = 0
         self.floor_color[None] = (1, 1, 1)
 
+    def _make_color_field(self):
+        if self.color_format == 'palette':
+            return ti.field(dtype=ti.u8)
+        dtype = {'f32': ti.f32, 'f16': ti.f16, 'u8': ti.u8}[self.color_format]
+        return ti.Vector.field(3, dtype=dtype)
+
+    def _make_radius_field(self):
+        dtype = {'f32': ti.f32, 'f16': ti.f16}[self.radius_format]
+        return ti.field(dtype=dtype)
+
+    @ti.func
+    def closest_palette_entry(self, color):
+        # Slots are reserved before their color is written. An entry only
+        # counts once none of its components holds PALETTE_UNSET anymore, so a
+        # reserved but unwritten slot is never mistaken for a (black) match.
+        index = -1
+        closest_dist = inf
+        for k in range(ti.min(self.palette_size[None], MAX_PALETTE_COLORS)):
+            entry = self.color_palette[k]
+            if (entry != PALETTE_UNSET).all():
+                dist = (entry - color).norm_sqr()
+                if dist < closest_dist:
+                    closest_dist = dist
+                    index = k
+        return index, closest_dist
+
+    @ti.func
+    def palette_index(self, color):
+        """
+        Return the palette index of color, adding it to the palette if it is
+        not present yet. Once the palette is full, the closest entry is used.
+        Particles added in parallel may create duplicate entries, see
+        compact_palette.
+        """
+        # Negative colors are meaningless and would collide with PALETTE_UNSET
+        color = ti.max(color, 0.0)
+        index, closest_dist = self.closest_palette_entry(color)
+
+        if closest_dist > 0 and self.palette_size[None] < MAX_PALETTE_COLORS:
+            new_index = ti.atomic_add(self.palette_size[None], 1)
+            if new_index < MAX_PALETTE_COLORS:
+                self.color_palette[new_index] = color
+                index = new_index
+            else:
+                # Lost the race for the last entries, undo the overflow
+                ti.atomic_min(self.palette_size[None], MAX_PALETTE_COLORS)
+                index, _ = self.closest_palette_entry(color)
+                # The palette is full, so every slot has been reserved by a
+                # thread that writes it right away; wait until one is visible
+                while index < 0:
+                    index, _ = self.closest_palette_entry(color)
+        return index
+
+    @ti.func
+    def encode_color(self, color):
+        """Convert an f32 RGB color into the storage format of particle_color."""
+        if ti.static(self.color_format == 'palette'):
+            return ti.cast(self.palette_index(color), ti.u8)
+        elif ti.static(self.color_format == 'u8'):
+            return self.to_vec3u(color)
+        else:
+            return color.cast(self.particle_color.dtype)
+
+    @ti.func
+    def decode_color(self, stored):
+        """Convert a value of particle_color back into an f32 RGB color."""
+        if ti.static(self.color_format == 'palette'):
+            return self.color_palette[ti.cast(stored, ti.i32)]
+        elif ti.static(self.color_format == 'u8'):
+            return self.to_vec3(stored)
+        else:
+            return stored.cast(ti.f32)
+
+    @ti.func
+    def get_particle_color(self, i):
+        return self.decode_color(self.particle_color[i])
+
+    @ti.func
+    def set_particle_color(self, i, color):
+        self.particle_color[i] = self.encode_color(color)
+
     @ti.func
     def add_particle(self, pos: ti.types.vector(3, ti.f32),
                      color: ti.types.vector(3, ti.f32),
@@ -76,10 +254,12 @@ class Renderer:
         if self.num_particles[None] < self.max_particles:
             new_idx = ti.atomic_add(self.num_particles[None], 1)
             self.particle_pos[new_idx] = pos
-            self.particle_color[new_idx] = color
+            self.set_particle_color(new_idx, color)
             self.particle_material[new_idx] = material
-            self.particle_radius[new_idx] = radius
+            self.particle_radius[new_idx] = ti.cast(radius, self.particle_radius.dtype)
             self.particle_velocity[new_idx] = velocity
+            self.particle_id[new_idx] = new_idx
+            self.particle_slot[new_idx] = new_idx
         else:
             print("Max particles reached, cannot add more. Consider increasing max_particles.")
 
@@ -131,25 +311,67 @@ class Renderer:
         return intersect, t
     
     @ti.func
-    def trace_particles(self, eye_pos, d):
+    def particle_radius_at(self, i, traits: ti.template()):
+        radius = 0.0
+        if ti.static(traits.uniform_radius):
+            radius = traits.radius
+        else:
+            radius = self.render_radius[i]
+        return radius
+
+    @ti.func
+    def particle_color_at(self, i, traits: ti.template()):
+        color = ti.Vector([0.0, 0.0, 0.0])
+        if ti.static(traits.uniform_color):
+            color = ti.Vector(traits.color)
+        else:
+            color = self.decode_color(self.render_color[i])
+        return color
+
+    @ti.func
+    def particle_material_at(self, i, traits: ti.template()):
+        material = ti.i8(0)
+        if ti.static(traits.uniform_material):
+            material = ti.i8(traits.material)
+        else:
+            material = self.render_material[i]
+        return material
+
+    @ti.func
+    def trace_particles(self, eye_pos, d, traits: ti.template()):
         closest_t = inf
         hit_normal_val = ti.Vector([0.0, 0.0, 0.0])
         hit_color_val = ti.Vector([0.0, 0.0, 0.0])
         hit_material_val = ti.i8(0)
         hit_light_flag = 0
 
-        for i in range(self.num_particles[None]):
-            p_pos = self.particle_pos[i]
-            p_radius = self.particle_radius[i]
-
-            is_hit, t = self.ray_sphere_intersection(p_pos, p_radius, eye_pos, d)
-
-            if is_hit and t < closest_t:
-                closest_t = t
-                hit_point = eye_pos + t * d
-                hit_normal_val = (hit_point - p_pos).normalized()
-                hit_color_val = self.particle_color[i]
-                hit_material_val = self.particle_material[i]
+        num_particles = self.render_num_particles[None]
+        visit_scene = 1
+        if ti.static(self.culling):
+            hit_bbox, _, far = ray_aabb_intersection(self.bbox[0], self.bbox[1], eye_pos, d)
+            visit_scene = hit_bbox and far > eps
+
+        if visit_scene:
+            for c in range((num_particles + CLUSTER_SIZE - 1) // CLUSTER_SIZE):
+                visit_cluster = 1
+                if ti.static(self.culling):
+                    hit_cluster, near, far = ray_aabb_intersection(
+                        self.cluster_min[c], self.cluster_max[c], eye_pos, d)
+                    visit_cluster = hit_cluster and far > eps and near < closest_t
+
+                if visit_cluster:
+                    for i in range(c * CLUSTER_SIZE, ti.min((c + 1) * CLUSTER_SIZE, num_particles)):
+                        p_pos = self.render_pos[i]
+                        p_radius = self.particle_radius_at(i, traits)
+
+                        is_hit, t = self.ray_sphere_intersection(p_pos, p_radius, eye_pos, d)
+
+                        if is_hit and t < closest_t:
+                            closest_t = t
+                            hit_point = eye_pos + t * d
+                            hit_normal_val = (hit_point - p_pos).normalized()
+                            hit_color_val = self.particle_color_at(i, traits)
+                            hit_material_val = self.particle_material_at(i, traits)
 
         if hit_material_val == MAT_LIGHT:
             hit_light_flag = 1
@@ -162,18 +384,19 @@ class Renderer:
 
 
     @ti.func
-    def next_hit(self, pos, d, t):
+    def next_hit(self, pos, d, t, traits: ti.template(), test_particles):
         closest = inf
         normal = ti.Vector([0.0, 0.0, 0.0])
         c = ti.Vector([0.0, 0.0, 0.0])
         hit_light = 0
-        closest_particle, normal_particle, c_particle, hit_light_particle, _ = self.trace_particles(pos, d)
+        if test_particles:
+            closest_particle, normal_particle, c_particle, hit_light_particle, _ = self.trace_particles(pos, d, traits)
 
-        if closest_particle < closest:
-            closest = closest_particle
-            normal = normal_particle
-            c = c_particle
-            hit_light = hit_light_particle
+            if closest_particle < closest:
+                closest = closest_particle
+                normal = normal_particle
+                c = c_particle
+                hit_light = hit_light_particle
 
         ray_march_dist = self.ray_march(pos, d)
         if ray_march_dist < DIS_LIMIT and ray_march_dist < closest:
@@ -185,21 +408,37 @@ class Renderer:
         return closest, normal, c, hit_light
 
     @ti.kernel
-    def set_camera_pos(self, x: ti.f32, y: ti.f32, z: ti.f32):
+    def _set_camera_pos(self, x: ti.f32, y: ti.f32, z: ti.f32):
         self.camera_pos[None] = ti.Vector([x, y, z])
 
     @ti.kernel
-    def set_up(self, x: ti.f32, y: ti.f32, z: ti.f32):
+    def _set_up(self, x: ti.f32, y: ti.f32, z: ti.f32):
         self.up[None] = ti.Vector([x, y, z]).normalized()
 
     @ti.kernel
-    def set_look_at(self, x: ti.f32, y: ti.f32, z: ti.f32):
+    def _set_look_at(self, x: ti.f32, y: ti.f32, z: ti.f32):
         self.look_at[None] = ti.Vector([x, y, z])
 
     @ti.kernel
-    def set_fov(self, fov: ti.f32):
+    def _set_fov(self, fov: ti.f32):
         self.fov[None] = fov
 
+    def set_camera_pos(self, x, y, z):
+        self._set_camera_pos(x, y, z)
+        self._primary_mask_dirty = True
+
+    def set_up(self, x, y, z):
+        self._set_up(x, y, z)
+        self._primary_mask_dirty = True
+
+    def set_look_at(self, x, y, z):
+        self._set_look_at(x, y, z)
+        self._primary_mask_dirty = True
+
+    def set_fov(self, fov):
+        self._set_fov(fov)
+        self._primary_mask_dirty = True
+
     @ti.func
     def get_cast_dir(self, u, v):
         fov = self.fov[None]
@@ -213,7 +452,7 @@ class Renderer:
         return d
 
     @ti.kernel
-    def render(self):
+    def render(self, traits: ti.template()):
         ti.loop_config(block_dim=256)
         for u, v in self.color_buffer:
             d = self.get_cast_dir(u, v)
@@ -231,7 +470,12 @@ class Renderer:
             # Tracing begin
             for bounce in range(MAX_RAY_DEPTH):
                 depth += 1
-                closest, normal, c, hit_light = self.next_hit(pos, d, t)
+                test_particles = 1
+                if ti.static(self.culling):
+                    if bounce == 0:
+                        test_particles = self.primary_mask[u, v]
+                closest, normal, c, hit_light = self.next_hit(pos, d, t, traits,
+                                                              test_particles)
                 hit_pos = pos + closest * d
                 if not hit_light and normal.norm() != 0 and closest < 1e8:
                     d = out_dir(normal)
@@ -250,7 +494,7 @@ class Renderer:
                         if dot > 0:
                             hit_light_ = 0
                             dist, _, _, hit_light_ = self.next_hit(
-                                pos, light_dir, t)
+                                pos, light_dir, t, traits, 1)
                             if dist > DIS_LIMIT:
                                 # far enough to hit directional light
                                 contrib += throughput * \
@@ -291,31 +535,261 @@ class Renderer:
                     self.color_buffer[i, j][c] * darken * self.exposure /
                     samples)
 
-    @ti.kernel
     def recompute_bbox(self):
+        self._recompute_bbox()
+        self._primary_mask_dirty = True
+
+    @ti.kernel
+    def _recompute_bbox(self):
         for d in ti.static(range(3)):
             self.bbox[0][d] = inf
             self.bbox[1][d] = -inf
         
-        for i in range(self.num_particles[None]):
-            pos = self.particle_pos[i]
-            radius = self.particle_radius[i]
+        for c in range(self.max_clusters):
+            self.cluster_min[c] = ti.Vector([inf, inf, inf])
+            self.cluster_max[c] = ti.Vector([-inf, -inf, -inf])
+
+        for i in range(self.render_num_particles[None]):
+            pos = self.render_pos[i]
+            radius = self.render_radius[i]
+            c = i // CLUSTER_SIZE
             for d_ax in ti.static(range(3)):
                 ti.atomic_min(self.bbox[0][d_ax], pos[d_ax] - radius)
                 ti.atomic_max(self.bbox[1][d_ax], pos[d_ax] + radius)
+                ti.atomic_min(self.cluster_min[c][d_ax], pos[d_ax] - radius)
+                ti.atomic_max(self.cluster_max[c][d_ax], pos[d_ax] + radius)
         
         # Ensure bbox is not inf if no particles are present
-        if self.num_particles[None] == 0:
+        if self.render_num_particles[None] == 0:
             for d_ax in ti.static(range(3)):
                 self.bbox[0][d_ax] = 0.0
                 self.bbox[1][d_ax] = 0.0
 
+    @ti.kernel
+    def _update_primary_mask(self):
+        # Project the corners of the particle bounds into pixel coordinates,
+        # inverting the mapping of get_cast_dir
+        fov = self.fov[None]
+        f = (self.look_at[None] - self.camera_pos[None]).normalized()
+        du = f.cross(self.up[None]).normalized()
+        dv = du.cross(f).normalized()
+
+        behind_camera = 0
+        u_min, v_min = inf, inf
+        u_max, v_max = -inf, -inf
+        for corner in ti.static(range(8)):
+            p = ti.Vector([self.bbox[(corner >> 0) & 1][0],
+                           self.bbox[(corner >> 1) & 1][1],
+                           self.bbox[(corner >> 2) & 1][2]])
+            rel = p - self.camera_pos[None]
+            z = rel.dot(f)
+            if z < eps:
+                behind_camera = 1
+            else:
+                fu = rel.dot(du) / z
+                fv = rel.dot(dv) / z
+                pu = (fu + fov * self.aspect_ratio + 1e-5) * self.image_res[1] / (2 * fov)
+                pv = (fv + fov + 1e-5) * self.image_res[1] / (2 * fov)
+                u_min, u_max = ti.min(u_min, pu), ti.max(u_max, pu)
+                v_min, v_max = ti.min(v_min, pv), ti.max(v_max, pv)
+
+        # Jittered samples cover [u, u + 1), keep a one pixel margin around that
+        for u, v in self.primary_mask:
+            inside = (u >= u_min - 2 and u <= u_max + 1 and
+                      v >= v_min - 2 and v <= v_max + 1)
+            self.primary_mask[u, v] = ti.i8(behind_camera or inside)
+
+    def compact_palette(self):
+        """
+        Merge duplicate palette entries, which parallel add_particle calls can
+        create, and remap the particle colors to the merged palette.
+        """
+        if self.color_format != 'palette':
+            return
+
+        size = min(self.palette_size[None], MAX_PALETTE_COLORS)
+        palette = self.color_palette.to_numpy()
+        unique, remap = np.unique(palette[:size], axis=0, return_inverse=True)
+        remap = remap.reshape(-1)
+
+        stores = [(self.particle_color, self.num_particles[None])]
+        if self.pipelined:
+            stores.append((self.render_color, self.render_num_particles[None]))
+        for field, n in stores:
+            colors = field.to_numpy()
+            colors[:n] = remap[colors[:n]].astype(colors.dtype)
+            field.from_numpy(colors)
+
+        palette[:len(unique)] = unique
+        palette[len(unique):] = PALETTE_UNSET
+        self.color_palette.from_numpy(palette)
+        self.palette_size[None] = len(unique)
+
+    def particle_memory_usage(self):
+        """
+        Return the bytes per particle of the attributes read by the renderer
+        ('render') and of all per-particle storage ('total').
+        """
+        render_fields = [self.render_pos, self.render_color,
+                         self.render_material, self.render_radius]
+        all_fields = self._particle_fields + [self.particle_slot, self._morton_code]
+        if self.pipelined:
+            all_fields += render_fields
+        return {'render': sum(field_element_bytes(f) for f in render_fields),
+                'total': sum(field_element_bytes(f) for f in all_fields)}
+
+    @ti.kernel
+    def _copy_render_snapshot(self):
+        self.render_num_particles[None] = self.num_particles[None]
+        for i in range(self.num_particles[None]):
+            self.render_pos[i] = self.particle_pos[i]
+            self.render_color[i] = self.particle_color[i]
+            self.render_material[i] = self.particle_material[i]
+            self.render_radius[i] = self.particle_radius[i]
+
+    def snapshot_particles(self):
+        """
+        Publish the current simulation state to the renderer. Only needed in
+        pipelined mode, otherwise the renderer reads the simulation state directly.
+        """
+        if self.pipelined:
+            self._copy_render_snapshot()
+
+    @ti.kernel
+    def _compute_morton_codes(self):
+        # Quantize over the bounds of the simulation state, which may be ahead
+        # of the rendered state (and self.bbox) in pipelined mode
+        for d in ti.static(range(3)):
+            self._morton_bbox[0][d] = inf
+            self._morton_bbox[1][d] = -inf
+
+        for i in range(self.num_particles[None]):
+            for d_ax in ti.static(range(3)):
+                ti.atomic_min(self._morton_bbox[0][d_ax], self.particle_pos[i][d_ax])
+                ti.atomic_max(self._morton_bbox[1][d_ax], self.particle_pos[i][d_ax])
+
+        for i in range(self.num_particles[None]):
+            self._morton_code[i] = morton3d(self.particle_pos[i],
+                                            self._morton_bbox[0],
+                                            self._morton_bbox[1])
+
+    @ti.kernel
+    def _update_particle_slots(self):
+        for i in range(self.num_particles[None]):
+            self.particle_slot[self.particle_id[i]] = i
+
+    def register_particle_field(self, field):
+        """
+        Register a user field indexed by particle slot so that it is kept in
+        sync when particles are reordered.
+        """
+        self._particle_fields.append(field)
+
+    def reorder_particles(self):
+        """
+        Sort the particle storage along a Morton curve so that particles that
+        are close in space are also close in memory. Registered per-particle
+        fields are permuted alongside, particle_slot is updated so that stable
+        ids keep pointing at their particle.
+        """
+        n = self.num_particles[None]
+        if n < 2:
+            return
+
+        self._compute_morton_codes()
+        order = np.argsort(self._morton_code.to_numpy()[:n], kind='stable')
+
+        for field in self._particle_fields:
+            data = field.to_numpy()
+            data[:n] = data[:n][order]
+            field.from_numpy(data)
+
+        self._update_particle_slots()
+
+        # Cluster bounds cover fixed slot ranges, which now hold other particles
+        self.recompute_bbox()
+
+    def detect_traits(self):
+        """
+        Return the SceneTraits of the particles currently seen by the renderer.
+        """
+        n = self.render_num_particles[None]
+        if n == 0:
+            return SceneTraits()
+
+        radius = self.render_radius.to_numpy()[:n]
+        material = self.render_material.to_numpy()[:n]
+        color = self.render_color.to_numpy()[:n]
+
+        uniform_radius = bool(np.all(radius == radius[0]))
+        uniform_material = bool(np.all(material == material[0]))
+        uniform_color = bool(np.all(color == color[0]))
+
+        return SceneTraits(
+            uniform_radius=uniform_radius,
+            radius=float(radius[0]) if uniform_radius else 0.0,
+            uniform_material=uniform_material,
+            material=int(material[0]) if uniform_material else 0,
+            uniform_color=uniform_color,
+            color=tuple(float(c) for c in self._render_color_at(0)) if uniform_color else (0.0, 0.0, 0.0))
+
+    @ti.kernel
+    def _render_color_at(self, i: ti.i32) -> ti.types.vector(3, ti.f32):
+        return self.decode_color(self.render_color[i])
+
+    def specialize(self, traits=None):
+        """
+        Render with kernels specialized to the given traits, or to the traits
+        detected from the current particles if none are given.
+        """
+        self.traits = traits if traits is not None else self.detect_traits()
+
+    @ti.kernel
+    def _count_trait_mismatches(self, traits: ti.template()) -> ti.types.vector(3, ti.i32):
+        # Particles whose radius, material and color differ from the traits
+        radius_mismatches = 0
+        material_mismatches = 0
+        color_mismatches = 0
+        for i in range(self.render_num_particles[None]):
+            if ti.static(traits.uniform_radius):
+                if self.render_radius[i] != traits.radius:
+                    radius_mismatches += 1
+            if ti.static(traits.uniform_material):
+                if self.render_material[i] != traits.material:
+                    material_mismatches += 1
+            if ti.static(traits.uniform_color):
+                if (self.decode_color(self.render_color[i]) != ti.Vector(traits.color)).any():
+                    color_mismatches += 1
+        return ti.Vector([radius_mismatches, material_mismatches, color_mismatches])
+
+    def validate_traits(self):
+        """
+        Drop the traits the particles no longer match, so that only those
+        attributes fall back to being read per particle.
+        """
+        if self.traits == SceneTraits():
+            return
+
+        radius_mismatches, material_mismatches, color_mismatches = \
+            self._count_trait_mismatches(self.traits)
+        traits = self.traits
+        if radius_mismatches:
+            traits = replace(traits, uniform_radius=False, radius=0.0)
+        if material_mismatches:
+            traits = replace(traits, uniform_material=False, material=0)
+        if color_mismatches:
+            traits = replace(traits, uniform_color=False, color=(0.0, 0.0, 0.0))
+        self.traits = traits
+
     def reset_framebuffer(self):
         self.current_spp = 0
         self.color_buffer.fill(0)
 
     def accumulate(self):
-        self.render()
+        if self.culling and self._primary_mask_dirty:
+            self._update_primary_mask()
+            self._primary_mask_dirty = False
+        self.render(self.traits)
         self.current_spp += 1
 
     def fetch_image(self):
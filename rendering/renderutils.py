@@ -1,6 +1,7 @@
 import math
 import taichi as ti
 import numpy as np
+from taichi.lang.util import to_numpy_type
 
 eps = 1e-4
 inf = 1e10
@@ -44,6 +45,36 @@ def ray_aabb_intersection(box_min, box_max, o, d):
     return intersect, near_int, far_int
 
 
+@ti.func
+def expand_bits(v):
+    # Spread the lower 10 bits of v so that there are two zero bits between each
+    v = (v * ti.u32(0x00010001)) & ti.u32(0xFF0000FF)
+    v = (v * ti.u32(0x00000101)) & ti.u32(0x0F00F00F)
+    v = (v * ti.u32(0x00000011)) & ti.u32(0xC30C30C3)
+    v = (v * ti.u32(0x00000005)) & ti.u32(0x49249249)
+    return v
+
+
+@ti.func
+def morton3d(p, box_min, box_max):
+    """
+    Return the 30 bit Morton code of point p, quantized to a 1024^3 grid
+    spanning the box [box_min, box_max].
+    """
+    extent = ti.max(box_max - box_min, eps)
+    q = ti.math.clamp((p - box_min) / extent * 1024.0, 0.0, 1023.0)
+    x = expand_bits(ti.cast(q[0], ti.u32))
+    y = expand_bits(ti.cast(q[1], ti.u32))
+    z = expand_bits(ti.cast(q[2], ti.u32))
+    return x * ti.u32(4) + y * ti.u32(2) + z
+
+
+def field_element_bytes(field):
+    """Return the number of bytes one element of a scalar or vector field occupies."""
+    components = field.n * field.m if isinstance(field, ti.MatrixField) else 1
+    return components * np.dtype(to_numpy_type(field.dtype)).itemsize
+
+
 def np_normalize(v):
     # https://stackoverflow.com/a/51512965/12003165
     return v / np.sqrt(np.sum(v**2))
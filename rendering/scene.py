@@ -27,6 +27,8 @@ class Scene:
         self.target_fps = args.target_fps
         self.resolution = (args.resolution[0], args.resolution[1])
         self.capture_video = args.capture
+        self.reorder_interval = args.reorder_interval
+        self.pipelined = args.pipelined
 
         self.window = ti.ui.Window("PyParticle Renderer",
                                    self.resolution,
@@ -41,15 +43,25 @@ class Scene:
         self.renderer = Renderer(image_res=self.resolution,
                                  up=UP_DIR,
                                  exposure=args.exposure,
-                                 max_particles=args.max_particles)
+                                 max_particles=args.max_particles,
+                                 pipelined=self.pipelined,
+                                 color_format=args.color_format,
+                                 radius_format=args.radius_format,
+                                 culling=args.culling)
 
         self.renderer.set_camera_pos(*self.camera.position)
 
+        # SceneTraits declared by the scene, detected at finish() when None
+        self.particle_traits = None
+
 
     @ti.func
     def add_particle(self, position, material, color, radius, velocity=vec3(0.0, 0.0, 0.0)):
         self.renderer.add_particle(position, color, material, radius, velocity)
 
+    def register_particle_field(self, field):
+        self.renderer.register_particle_field(field)
+
     def set_floor(self, height, color):
         self.renderer.floor_height[None] = height
         self.renderer.floor_color[None] = color
@@ -60,10 +72,18 @@ class Scene:
     def set_background_color(self, color):
         self.renderer.background_color[None] = color
 
+    def _maybe_reorder_particles(self, frame):
+        if self.reorder_interval > 0 and frame % self.reorder_interval == 0:
+            self.renderer.reorder_particles()
+
     def finish(self):
+        self.renderer.compact_palette()
+        self.renderer.snapshot_particles()
         self.renderer.recompute_bbox()
+        self.renderer.specialize(self.particle_traits)
         canvas = self.window.get_canvas()
         spp = 1
+        frame = 0
 
         if self.capture_video:
             video_manager = ti.tools.VideoManager(
@@ -87,8 +107,20 @@ class Scene:
                 should_reset_framebuffer = True
 
             if self.renderer.num_particles[None] > 0:
-                self.update_particles(dt)
-                self.renderer.recompute_bbox()
+                if self.pipelined:
+                    # Publish step N to the renderer, then launch step N+1 on
+                    # the working copy before frame N is rendered. All Taichi
+                    # calls stay on this thread, the frontend is not thread-safe.
+                    self._maybe_reorder_particles(frame)
+                    self.renderer.snapshot_particles()
+                    self.renderer.recompute_bbox()
+                    self.renderer.validate_traits()
+                    self.update_particles(dt)
+                else:
+                    self.update_particles(dt)
+                    self._maybe_reorder_particles(frame)
+                    self.renderer.recompute_bbox()
+                    self.renderer.validate_traits()
                 should_reset_framebuffer = True
 
             if should_reset_framebuffer:
@@ -122,6 +154,7 @@ class Scene:
                 spp = max(spp, 1)
             else:
                 spp += 1
+            frame += 1
             self.window.show()
 
         if self.capture_video: